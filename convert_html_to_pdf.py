@@ -4,18 +4,186 @@ Script to convert local HTML files to PDF using pwhtmltopdf library.
 """
 
 import asyncio
+import collections
+import copy
+import functools
+import itertools
 import os
 import sys
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 import tempfile
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import html
 
-from bs4 import BeautifulSoup
-from pwhtmltopdf import HtmlToPdf
+# lxml and pwhtmltopdf are imported inside the functions that use them, so commands
+# like --create-sample start without loading the parser or the browser bindings
 
 
-async def convert_html_to_pdf(html_file_path, pdf_output_path=None, pdf_options=None):
+# Links that never point to a local HTML file: any URL scheme (http:, mailto:, javascript:, ...),
+# protocol-relative URLs and in-page anchors. A scheme needs two letters, so C:\ paths are kept.
+SKIP_RE = re.compile(r'^(?:[a-z][a-z0-9+.\-]+:|//|#)', re.IGNORECASE)
+
+# File suffixes treated as HTML pages
+HTML_SUFFIXES = frozenset({'.html', '.htm'})
+
+# Most linked HTML files the crawl reads ahead of the walk at once
+MAX_PENDING_READS = 16
+
+# Tags that make a merged file need a real parse: links to rewrite and CSS to collect
+NEEDS_PARSE_RE = re.compile(rb'<(?:a[\s>]|style|link)', re.IGNORECASE)
+BODY_OPEN_RE = re.compile(rb'<body[^>]*>', re.IGNORECASE)
+BODY_CLOSE_RE = re.compile(rb'</body\s*>', re.IGNORECASE)
+
+# href values of <a> tags in raw HTML: double-quoted, single-quoted or unquoted.
+# Earlier attributes are skipped whole, so a '>' or 'href=' inside their quoted values is not read as the tag end or a link.
+HREF_RE = re.compile(rb'''<a\s(?:(?:[^>"']|"[^"]*"|'[^']*')*?(?:\s|(?<=["'])))?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+# Comments and scripts, whose <a> tags are not real links
+UNLINKED_RE = re.compile(rb'<!--.*?-->|<script\b.*?</script\s*>', re.IGNORECASE | re.DOTALL)
+
+# PDF options used when none are given: A4 pages with backgrounds and 20px margins
+DEFAULT_PDF_OPTIONS = {
+    'format': 'A4',
+    'print_background': True,
+    'margin': {
+        'top': '20px',
+        'bottom': '20px',
+        'left': '20px',
+        'right': '20px'
+    }
+}
+
+# Layout fixes appended to the head of merged documents
+MERGED_LAYOUT_CSS = '''
+        <style>
+        /* Fix navigation elements that might overlap */
+        .chain, .path, .breadcrumb, .nav-path, .navbar, .navigation {
+            clear: both !important;
+            margin-bottom: 15px !important;
+            display: block !important;
+            float: none !important;
+            position: relative !important;
+        }
+        
+        /* Ensure proper spacing between navigation elements */
+        .chain + .path, .path + .chain {
+            margin-top: 10px !important;
+        }
+        
+        /* Fix any floating issues */
+        .merged-nav-wrapper {
+            clear: both !important;
+            display: block !important;
+            margin-bottom: 15px !important;
+            overflow: hidden !important;
+        }
+        
+        /* Ensure section divs have proper spacing */
+        div[id^="section-"] {
+            clear: both !important;
+            margin-top: 40px !important;
+        }
+        </style>
+        '''
+
+# Static document written by create_sample_html
+_SAMPLE_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Sample HTML for PDF Conversion</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            margin: 40px;
+            background-color: #f5f5f5;
+        }
+        .header {
+            background-color: #4CAF50;
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }
+        .content {
+            margin: 20px 0;
+            padding: 20px;
+            background-color: white;
+            border-radius: 5px;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin: 20px 0;
+        }
+        th, td {
+            border: 1px solid #ddd;
+            padding: 8px;
+            text-align: left;
+        }
+        th {
+            background-color: #f2f2f2;
+        }
+        .footer {
+            margin-top: 20px;
+            text-align: center;
+            color: #666;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Sample HTML Document</h1>
+        <p>This is a sample HTML document for PDF conversion</p>
+    </div>
+    
+    <div class="content">
+        <h2>About This Document</h2>
+        <p>This document demonstrates the capabilities of converting HTML to PDF using pwhtmltopdf library. It includes:</p>
+        <ul>
+            <li>Styled text with CSS</li>
+            <li>Tables with borders</li>
+            <li>Formatted headings and paragraphs</li>
+            <li>Background colors</li>
+        </ul>
+        
+        <h2>Sample Table</h2>
+        <table>
+            <tr>
+                <th>Product</th>
+                <th>Price</th>
+                <th>Category</th>
+            </tr>
+            <tr>
+                <td>Widget A</td>
+                <td>$19.99</td>
+                <td>Electronics</td>
+            </tr>
+            <tr>
+                <td>Widget B</td>
+                <td>$29.99</td>
+                <td>Home</td>
+            </tr>
+            <tr>
+                <td>Widget C</td>
+                <td>$39.99</td>
+                <td>Office</td>
+            </tr>
+        </table>
+        
+        <h2>Additional Content</h2>
+        <p>Lorem ipsum dolor sit amet, consectetur adipiscing elit. Nullam auctor, nisl eget ultricies tincidunt, nisl nisl aliquam nisl, eget ultricies nisl nisl eget nisl. Nullam auctor, nisl eget ultricies tincidunt, nisl nisl aliquam nisl, eget ultricies nisl nisl eget nisl.</p>
+    </div>
+    
+    <div class="footer">
+        <p>Generated on: October 3, 2025</p>
+    </div>
+</body>
+</html>"""
+
+
+async def convert_html_to_pdf(html_file_path, pdf_output_path=None, pdf_options=None, converter=None):
     """
     Convert a local HTML file to PDF using pwhtmltopdf.
     
@@ -23,6 +191,8 @@ async def convert_html_to_pdf(html_file_path, pdf_output_path=None, pdf_options=
         html_file_path (str or Path): Path to the input HTML file
         pdf_output_path (str or Path, optional): Path for the output PDF file
         pdf_options (dict, optional): Options for PDF generation
+        converter (HtmlToPdf, optional): Shared converter to reuse; it is left open for the caller
+            to close. Its own PDF options are used instead of pdf_options.
     
     Returns:
         bytes: PDF content if no output path is provided
@@ -35,19 +205,13 @@ async def convert_html_to_pdf(html_file_path, pdf_output_path=None, pdf_options=
     
     # Set default PDF options if not provided
     if pdf_options is None:
-        pdf_options = {
-            'format': 'A4',
-            'print_background': True,
-            'margin': {
-                'top': '20px',
-                'bottom': '20px',
-                'left': '20px',
-                'right': '20px'
-            }
-        }
+        pdf_options = copy.deepcopy(DEFAULT_PDF_OPTIONS)
     
-    # Create HtmlToPdf instance with PDF options
-    converter = HtmlToPdf(pdf_kwargs=pdf_options)
+    # Create HtmlToPdf instance with PDF options unless a shared one was given
+    owns_converter = converter is None
+    if owns_converter:
+        from pwhtmltopdf import HtmlToPdf
+        converter = HtmlToPdf(pdf_kwargs=pdf_options)
     
     try:
         # Convert the HTML file to PDF
@@ -63,88 +227,339 @@ async def convert_html_to_pdf(html_file_path, pdf_output_path=None, pdf_options=
         print(f"Error converting HTML to PDF: {str(e)}")
         raise
     finally:
-        # Close the converter
-        await converter.close()
+        # Close the converter if it was created here
+        if owns_converter:
+            await converter.close()
 
 
 def collect_linked_html_files_recursive(start_file_path, max_depth=10):
     """
     Recursively collect all linked HTML files starting from a root file.
     
+    The link graph is walked depth-first with an explicit worklist, so deep hierarchies
+    cannot hit Python's recursion limit.
+    
     Args:
         start_file_path (str or Path): Path to the starting HTML file
-        max_depth (int): Maximum recursion depth to prevent infinite loops
+        max_depth (int): Maximum link depth to follow, to prevent infinite loops
     
     Returns:
         list: Ordered list of unique HTML file paths
     """
-    start_path = Path(start_file_path).resolve()
+    start_path = str(Path(start_file_path).resolve())
     visited = set()
     ordered_files = []
     
-    def extract_links_from_file(file_path, depth=0):
-        """Recursively extract links from an HTML file."""
-        if depth > max_depth:
-            print(f"Warning: Max depth {max_depth} reached, stopping recursion")
-            return
+    # Depth-first worklist of (path, depth); children are pushed in reverse so they are
+    # visited in the order their links appear, matching a recursive walk without its frames
+    worklist = [(start_path, 0)]
+    
+    # The next files the walk will visit are read ahead on a thread pool, so their disk reads
+    # overlap while the walk itself keeps its depth-first order. At most MAX_PENDING_READS
+    # files are read ahead at once, which bounds the bytes held before they are scanned.
+    read_pool = ThreadPoolExecutor(max_workers=MAX_PENDING_READS)
+    pending_reads = {}
+    
+    try:
+        while worklist:
+            file_str, depth = worklist.pop()
+            
+            # Skip if already visited
+            if file_str in visited:
+                continue
+            
+            if depth > max_depth:
+                print(f"Warning: Max depth {max_depth} reached, stopping recursion")
+                continue
+            
+            # Mark as visited and add to ordered list
+            visited.add(file_str)
+            ordered_files.append(file_str)
+            
+            # Scan the raw bytes for links; the crawl needs only hrefs, not a document tree
+            parent_dir = os.path.dirname(file_str)
+            linked_files = []
+            try:
+                read = pending_reads.pop(file_str, None)
+                content = read.result() if read else Path(file_str).read_bytes()
+                content = UNLINKED_RE.sub(b'', content)
+                
+                # Collect all links in the order they appear
+                for match in HREF_RE.finditer(content):
+                    href = match.group(1) or match.group(2) or match.group(3) or b''
+                    href = html.unescape(href.decode('utf-8', errors='replace'))
+                    
+                    # Skip missing hrefs, external links, anchors, and special protocols
+                    if not href or SKIP_RE.match(href):
+                        continue
+                    
+                    # Remove fragment identifiers (anchors) from the path
+                    if '#' in href:
+                        href = href.split('#')[0]
+                    
+                    # Skip empty hrefs after removing anchors
+                    if not href:
+                        continue
+                    
+                    # Make relative paths absolute with string operations; only isfile() touches the disk
+                    abs_path = os.path.normpath(os.path.join(parent_dir, href))
+                    
+                    # Skip links to files we already collected before touching the filesystem
+                    if abs_path in visited:
+                        continue
+                    
+                    # Check it is an HTML file by name before checking that it exists
+                    if os.path.splitext(abs_path)[1].lower() in HTML_SUFFIXES and os.path.isfile(abs_path):
+                        linked_files.append(abs_path)
+            
+            except Exception as e:
+                print(f"Warning: Error reading file {file_str}: {e}")
+            
+            # Queue the linked files one level deeper
+            worklist.extend((linked_path, depth + 1) for linked_path in reversed(linked_files))
+            
+            # Start reads for the files at the top of the worklist, which are visited next
+            for next_path, next_depth in itertools.islice(reversed(worklist), 2 * MAX_PENDING_READS):
+                if len(pending_reads) >= MAX_PENDING_READS:
+                    break
+                if next_depth <= max_depth and next_path not in visited and next_path not in pending_reads:
+                    pending_reads[next_path] = read_pool.submit(Path(next_path).read_bytes)
+    finally:
+        # Drop read-aheads for files that were never visited, also when the walk is interrupted
+        read_pool.shutdown(cancel_futures=True)
+    
+    return ordered_files
+
+
+def read_stylesheet(css_path):
+    """
+    Read a linked CSS file, caching its contents for later merges in the same process.
+    
+    The cache is keyed on the file's modification time as well as its path, so a stylesheet
+    edited between merges is read again.
+    
+    Args:
+        css_path (str): Normalized absolute path to the stylesheet
+    
+    Returns:
+        str: Stylesheet contents, or None if the file does not exist
+    """
+    try:
+        mtime_ns = os.stat(css_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _read_stylesheet_version(css_path, mtime_ns)
+
+
+@functools.lru_cache(maxsize=256)
+def _read_stylesheet_version(css_path, mtime_ns):
+    """Read one version of a stylesheet; mtime_ns only takes part in the cache key."""
+    try:
+        return Path(css_path).read_bytes().decode('utf-8')
+    except FileNotFoundError:
+        return None
+
+
+def parse_html_file(html_file, file_to_anchor):
+    """
+    Parse a single HTML file for merging: collect its CSS and rewrite its internal links.
+    
+    Args:
+        html_file (str): Path to the HTML file
+        file_to_anchor (dict): Map of normcased merged file paths to their section anchor IDs
+    
+    Returns:
+        tuple: (list of embedded CSS strings, list of linked stylesheet paths, body content HTML string)
+    """
+    import lxml.etree
+    import lxml.html
+    
+    # Read raw bytes; the parser decodes them itself
+    content = Path(html_file).read_bytes()
+    
+    if not content.strip():
+        return [], [], ''
+    
+    # Plain prose files have nothing to collect or rewrite, so slice the body out of the raw bytes
+    if not NEEDS_PARSE_RE.search(content):
+        body_open = BODY_OPEN_RE.search(content)
+        if body_open:
+            body_close = BODY_CLOSE_RE.search(content, body_open.end())
+            end = body_close.start() if body_close else len(content)
+            return [], [], content[body_open.end():end].decode('utf-8', errors='replace')
+    
+    # lxml parsers lock while parsing, so each call (and thread) gets its own
+    try:
+        tree = lxml.html.document_fromstring(content, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    except lxml.etree.ParserError:
+        # Nothing but a comment or doctype: there is no document content to merge
+        return [], [], ''
+    
+    # Relative links are joined onto the file's directory with string operations, no filesystem calls
+    parent_dir = os.path.dirname(html_file)
+    
+    # Collect styles and stylesheets and rewrite links in a single walk over the tree
+    styles = []
+    stylesheets = []
+    new_hrefs = {}
+    for tag in tree.iter('style', 'link', 'a'):
+        # Extract any embedded styles
+        if tag.tag == 'style':
+            styles.append(tag.text or '')
+            continue
         
-        file_path = Path(file_path).resolve()
-        file_str = str(file_path)
+        href = tag.get('href')
+        if not href:
+            continue
         
-        # Skip if already visited
-        if file_str in visited:
-            return
+        # Extract CSS files; they are read once per merge by the caller
+        if tag.tag == 'link':
+            if 'stylesheet' in (tag.get('rel') or '').split():
+                stylesheets.append(os.path.normpath(os.path.join(parent_dir, href)))
+            continue
         
-        # Mark as visited and add to ordered list
-        visited.add(file_str)
-        ordered_files.append(file_str)
+        # Only process internal links (not external, mailto, other URL schemes, etc.)
+        if SKIP_RE.match(href):
+            continue
         
-        # Parse the file to extract links
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+        # Work out each distinct href's replacement once; pages repeat their navigation links
+        if href in new_hrefs:
+            new_href = new_hrefs[href]
+        else:
+            # Convert relative path to absolute
+            link_abs_str = os.path.normcase(os.path.normpath(os.path.join(parent_dir, href)))
             
-            soup = BeautifulSoup(content, 'html.parser')
+            # If this link points to one of our merged files, point it to the internal anchor
+            anchor = file_to_anchor.get(link_abs_str)
+            new_href = new_hrefs[href] = f'#{anchor}' if anchor else None
+        
+        if new_href:
+            tag.set('href', new_href)
+    
+    # Extract body content, or the whole content if there is no body tag.
+    # Children are serialized by lxml's C serializer; each one carries its own tail text.
+    body = tree.find('body')
+    if body is None:
+        return styles, stylesheets, lxml.html.tostring(tree, encoding='unicode')
+    
+    parts = [html.escape(body.text, quote=False)] if body.text else []
+    parts.extend(lxml.html.tostring(child, encoding='unicode') for child in body)
+    return styles, stylesheets, ''.join(parts)
+
+
+# Anchor map shared by every task in a parse worker process, set once by _init_parse_worker
+_worker_file_to_anchor = None
+
+
+def _init_parse_worker(file_to_anchor):
+    """Store the anchor map in a parse worker process so it is not pickled with every task."""
+    global _worker_file_to_anchor
+    _worker_file_to_anchor = file_to_anchor
+
+
+def _parse_html_file_in_worker(html_file):
+    """Run parse_html_file in a worker process against its stored anchor map."""
+    return parse_html_file(html_file, _worker_file_to_anchor)
+
+
+async def write_merged_html(all_files, file_to_anchor, temp_html_path, temp_css_path):
+    """
+    Write the combined document for merge_linked_html_to_pdf.
+    
+    The combined CSS is only known once every file is parsed, so the head links it from
+    temp_css_path, which is written last. The sections are streamed into temp_html_path as
+    each file is parsed, and only the CSS references of each file are kept in memory.
+    
+    Args:
+        all_files (list): Ordered paths of the HTML files to merge
+        file_to_anchor (dict): Map of normcased merged file paths to their section anchor IDs
+        temp_html_path (str): Path the combined HTML is written to
+        temp_css_path (str): Path the combined CSS is written to
+    """
+    # Stream the combined HTML straight into a temporary file instead of building one large string.
+    # HtmlToPdf.from_string is no cheaper: it writes its own temporary file and needs the whole string.
+    file_css = []
+    with open(temp_html_path, 'w', encoding='utf-8') as temp_file:
+        write = temp_file.write
+        
+        write('<!DOCTYPE html><html><head><meta charset="utf-8">')
+        write('<title>Combined Document</title>')
+        
+        # Add combined CSS with additional styles to fix navigation overlap
+        write(f'<link rel="stylesheet" href="{Path(temp_css_path).as_uri()}">')
+        
+        # Add custom CSS to fix navigation layout issues
+        write(MERGED_LAYOUT_CSS)
+        
+        write('</head><body>')
+        
+        # Read and parse the files across CPU cores, taking the results in document order
+        loop = asyncio.get_running_loop()
+        max_workers = max(1, min(os.cpu_count() or 1, len(all_files)))
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_parse_worker,
+            initargs=(file_to_anchor,)
+        ) as pool:
+            # Keep a bounded window of parses in flight; each result is written and dropped
+            # before the next file is submitted, so finished bodies cannot pile up in memory
+            files_to_submit = iter(all_files)
+            parses = collections.deque(
+                loop.run_in_executor(pool, _parse_html_file_in_worker, html_file)
+                for html_file in itertools.islice(files_to_submit, 2 * max_workers)
+            )
             
-            # Collect all links in the order they appear
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                
-                # Skip external links, anchors, and special protocols
-                if href.startswith(('http:', 'https:', 'mailto:', '#', 'javascript:', 'tel:', 'ftp:')):
-                    continue
+            # Add content from each file with appropriate separation and named anchors
+            for i, html_file in enumerate(all_files):
+                styles, stylesheets, body_content = await parses.popleft()
+                next_file = next(files_to_submit, None)
+                if next_file is not None:
+                    parses.append(loop.run_in_executor(pool, _parse_html_file_in_worker, next_file))
+                file_css.append((styles, stylesheets))
                 
-                # Remove fragment identifiers (anchors) from the path
-                if '#' in href:
-                    href = href.split('#')[0]
+                # Add a named anchor for internal navigation
+                anchor_name = f"section-{i}"
+                write(f'<div id="{anchor_name}" style="margin-top: 40px;">')
                 
-                # Skip empty hrefs after removing anchors
-                if not href:
-                    continue
+                # Add a separator between documents
+                if i > 0:
+                    write('<div style="page-break-before: always; height: 20px;"></div>')
+                write(f'<!-- Content from {html_file} -->')
+                write(body_content)
                 
-                # Make relative paths absolute
-                try:
-                    abs_path = (file_path.parent / href).resolve()
-                    
-                    # Check if the file exists and is an HTML file
-                    if abs_path.exists() and abs_path.is_file():
-                        if abs_path.suffix.lower() in ['.html', '.htm']:
-                            # Recursively process this linked file
-                            extract_links_from_file(abs_path, depth + 1)
-                except Exception as e:
-                    print(f"Warning: Could not resolve link '{href}' from {file_path}: {e}")
-                    continue
+                write('</div>')  # Close the section div
+                del body_content
         
-        except Exception as e:
-            print(f"Warning: Error reading file {file_path}: {e}")
+        write('</body></html>')
     
-    # Start the recursive extraction
-    extract_links_from_file(start_path, depth=0)
+    # Read every distinct linked stylesheet concurrently
+    css_paths = list(dict.fromkeys(
+        css_path for _, stylesheets in file_css for css_path in stylesheets
+    ))
+    css_contents = dict(zip(css_paths, await asyncio.gather(
+        *(asyncio.to_thread(read_stylesheet, css_path) for css_path in css_paths)
+    )))
     
-    return ordered_files
+    # Combine the CSS of all files in document order, skipping repeated blocks
+    all_css = []
+    seen_css = set()
+    for styles, stylesheets in file_css:
+        for style in styles:
+            if style not in seen_css:
+                seen_css.add(style)
+                all_css.append(style)
+        
+        for css_path in stylesheets:
+            css = css_contents[css_path]
+            if css is not None and css not in seen_css:
+                seen_css.add(css)
+                all_css.append(css)
+    
+    Path(temp_css_path).write_text('\n'.join(all_css), encoding='utf-8')
 
 
-async def merge_linked_html_to_pdf(index_file_path, pdf_output_path=None, pdf_options=None, max_depth=10):
+async def merge_linked_html_to_pdf(index_file_path, pdf_output_path=None, pdf_options=None, max_depth=10,
+                                   converter=None):
     """
     Follow all links in an index HTML file recursively and merge all content into a single PDF.
     
@@ -153,6 +568,8 @@ async def merge_linked_html_to_pdf(index_file_path, pdf_output_path=None, pdf_op
         pdf_output_path (str or Path, optional): Path for the output PDF file
         pdf_options (dict, optional): Options for PDF generation
         max_depth (int, optional): Maximum recursion depth for following links (default: 10)
+        converter (HtmlToPdf, optional): Shared converter to reuse; it is left open for the caller
+            to close. Its own PDF options are used instead of pdf_options.
     
     Returns:
         bytes: PDF content if no output path is provided
@@ -165,148 +582,40 @@ async def merge_linked_html_to_pdf(index_file_path, pdf_output_path=None, pdf_op
     
     # Set default PDF options if not provided
     if pdf_options is None:
-        pdf_options = {
-            'format': 'A4',
-            'print_background': True,
-            'margin': {
-                'top': '20px',
-                'bottom': '20px',
-                'left': '20px',
-                'right': '20px'
-            }
-        }
+        pdf_options = copy.deepcopy(DEFAULT_PDF_OPTIONS)
     
     # Recursively collect all linked HTML files
     all_files = collect_linked_html_files_recursive(index_path, max_depth=max_depth)
     
     print(f"Found {len(all_files)} HTML files across multiple hierarchy levels to merge")
     
-    # Create a temporary HTML file that combines all content
-    combined_html = '<!DOCTYPE html><html><head><meta charset="utf-8">'
-    combined_html += '<title>Combined Document</title>'
-    
-    # Extract and combine all CSS styles from the HTML files
-    all_css = []
-    for html_file in all_files:
-        with open(html_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            file_soup = BeautifulSoup(content, 'html.parser')
-            
-            # Extract any embedded styles
-            for style_tag in file_soup.find_all('style'):
-                all_css.append(style_tag.decode_contents())
-            
-            # Extract CSS files
-            for link_tag in file_soup.find_all('link', rel='stylesheet'):
-                css_href = link_tag.get('href')
-                if css_href:
-                    css_path = (Path(html_file).parent / css_href).resolve()
-                    if css_path.exists():
-                        with open(css_path, 'r', encoding='utf-8') as css_file:
-                            all_css.append(css_file.read())
-    
-    # Add combined CSS with additional styles to fix navigation overlap
-    if all_css:
-        combined_html += '<style>' + '\n'.join(all_css) + '</style>'
-    
-    # Add custom CSS to fix navigation layout issues
-    combined_html += '''
-    <style>
-    /* Fix navigation elements that might overlap */
-    .chain, .path, .breadcrumb, .nav-path, .navbar, .navigation {
-        clear: both !important;
-        margin-bottom: 15px !important;
-        display: block !important;
-        float: none !important;
-        position: relative !important;
-    }
-    
-    /* Ensure proper spacing between navigation elements */
-    .chain + .path, .path + .chain {
-        margin-top: 10px !important;
-    }
-    
-    /* Fix any floating issues */
-    .merged-nav-wrapper {
-        clear: both !important;
-        display: block !important;
-        margin-bottom: 15px !important;
-        overflow: hidden !important;
-    }
-    
-    /* Ensure section divs have proper spacing */
-    div[id^="section-"] {
-        clear: both !important;
-        margin-top: 40px !important;
-    }
-    </style>
-    '''
-    
-    combined_html += '</head><body>'
-    
     # Create a map to convert file paths to internal anchor IDs
     file_to_anchor = {}
     for i, html_file in enumerate(all_files):
-        file_to_anchor[html_file] = f"section-{i}"
+        file_to_anchor[os.path.normcase(html_file)] = f"section-{i}"
     
-    # Add content from each file with appropriate separation and named anchors
-    for i, html_file in enumerate(all_files):
-        # Add a named anchor for internal navigation
-        anchor_name = f"section-{i}"
-        combined_html += f'<div id="{anchor_name}" style="margin-top: 40px;">'
-        
-        with open(html_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            file_soup = BeautifulSoup(content, 'html.parser')
-            
-            # Process all links in the content to convert them to internal anchors
-            for link_tag in file_soup.find_all('a', href=True):
-                href = link_tag.get('href')
-                # Only process internal links (not external, mailto, etc.)
-                if not href.startswith(('http', 'https', 'mailto:', '#', 'javascript:')):
-                    try:
-                        # Convert relative path to absolute
-                        link_abs_path = (Path(html_file).parent / href).resolve()
-                        link_abs_str = str(link_abs_path)
-                        
-                        # Check if this link points to one of our merged files
-                        for merged_file in all_files:
-                            if link_abs_str == merged_file:
-                                # Change the href to point to the internal anchor
-                                link_tag['href'] = f'#{file_to_anchor[merged_file]}'
-                                break
-                    except:
-                        # If there's an issue with path resolution, keep the original link
-                        pass
-            
-            # Extract and add body content
-            body = file_soup.find('body')
-            if body:
-                body_content = str(body.decode_contents())
-                # Add a separator between documents
-                if i > 0:
-                    combined_html += '<div style="page-break-before: always; height: 20px;"></div>'
-                combined_html += f'<!-- Content from {html_file} -->'
-                combined_html += body_content
-            else:
-                # If no body tag, just add the content
-                if i > 0:
-                    combined_html += '<div style="page-break-before: always; height: 20px;"></div>'
-                combined_html += f'<!-- Content from {html_file} -->'
-                combined_html += str(file_soup)
-        
-        combined_html += '</div>'  # Close the section div
+    # Write the combined HTML and CSS to temporary files for the converter
+    with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as temp_file:
+        temp_html_path = temp_file.name
+    with tempfile.NamedTemporaryFile(suffix='.css', delete=False) as css_file:
+        temp_css_path = css_file.name
+    
+    try:
+        await write_merged_html(all_files, file_to_anchor, temp_html_path, temp_css_path)
+    except BaseException:
+        Path(temp_html_path).unlink(missing_ok=True)
+        Path(temp_css_path).unlink(missing_ok=True)
+        raise
     
-    combined_html += '</body></html>'
     
-    # Write the combined HTML to a temporary file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as temp_file:
-        temp_file.write(combined_html)
-        temp_html_path = temp_file.name
+    # Create HtmlToPdf instance with PDF options unless a shared one was given
+    owns_converter = converter is None
+    if owns_converter:
+        from pwhtmltopdf import HtmlToPdf
+        converter = HtmlToPdf(pdf_kwargs=pdf_options)
     
     try:
         # Convert the combined HTML to PDF
-        converter = HtmlToPdf(pdf_kwargs=pdf_options)
         pdf_content = await converter.from_file(
             file=temp_html_path,
             output_path=pdf_output_path
@@ -319,10 +628,32 @@ async def merge_linked_html_to_pdf(index_file_path, pdf_output_path=None, pdf_op
         print(f"Error merging HTML files to PDF: {str(e)}")
         raise
     finally:
-        # Close the converter
-        await converter.close()
-        # Clean up the temporary file
+        # Close the converter if it was created here
+        if owns_converter:
+            await converter.close()
+        # Clean up the temporary files
         Path(temp_html_path).unlink(missing_ok=True)
+        Path(temp_css_path).unlink(missing_ok=True)
+
+
+def get_conversion_concurrency():
+    """
+    Read the number of concurrent directory conversions from HTML2PDF_CONCURRENCY.
+    
+    Returns:
+        int: The configured value, or 4 if the variable is not set
+    
+    Raises:
+        ValueError: If the value is not a positive integer
+    """
+    value = os.getenv('HTML2PDF_CONCURRENCY', '4')
+    try:
+        concurrency = int(value)
+    except ValueError:
+        concurrency = 0
+    if concurrency < 1:
+        raise ValueError(f"HTML2PDF_CONCURRENCY must be a positive integer, got '{value}'")
+    return concurrency
 
 
 async def convert_multiple_html_files(html_directory, output_directory=None, pdf_options=None):
@@ -333,7 +664,13 @@ async def convert_multiple_html_files(html_directory, output_directory=None, pdf
         html_directory (str or Path): Directory containing HTML files
         output_directory (str or Path, optional): Directory for output PDFs
         pdf_options (dict, optional): Options for PDF generation
+    
+    Returns:
+        list: HTML files that failed to convert (empty if all succeeded)
     """
+    # Limit how many headless browser renders run at the same time
+    concurrency = get_conversion_concurrency()
+    
     html_dir = Path(html_directory)
     
     if output_directory is None:
@@ -346,115 +683,58 @@ async def convert_multiple_html_files(html_directory, output_directory=None, pdf
     
     if not html_files:
         print(f"No HTML files found in '{html_directory}'")
-        return
+        return []
     
     print(f"Found {len(html_files)} HTML files to convert")
     
+    # Set default PDF options if not provided
+    if pdf_options is None:
+        pdf_options = copy.deepcopy(DEFAULT_PDF_OPTIONS)
+    
+    from pwhtmltopdf import HtmlToPdf
+    
+    # Share one converter (and so one headless browser) across the batch; each
+    # conversion opens its own page, so concurrent use is safe
+    converter = HtmlToPdf(pdf_kwargs=pdf_options)
+    
+    # Files sharing a stem (a.html and a.htm) would render into the same PDF at the same
+    # time, so those keep their HTML suffix in the output name
+    stem_counts = collections.Counter(html_file.stem.casefold() for html_file in html_files)
+    pdf_output_paths = {}
     for html_file in html_files:
-        pdf_output_path = Path(output_directory) / f"{html_file.stem}.pdf"
-        await convert_html_to_pdf(html_file, pdf_output_path, pdf_options)
-
-
-def create_sample_html(file_path):
-    """Create a sample HTML file for testing."""
+        if stem_counts[html_file.stem.casefold()] > 1:
+            pdf_name = f"{html_file.name}.pdf"
+            print(f"Warning: '{html_file.name}' shares its name with another HTML file, writing '{pdf_name}'")
+        else:
+            pdf_name = f"{html_file.stem}.pdf"
+        pdf_output_paths[html_file] = Path(output_directory) / pdf_name
     
-    html_content = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Sample HTML for PDF Conversion</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            margin: 40px;
-            background-color: #f5f5f5;
-        }
-        .header {
-            background-color: #4CAF50;
-            color: white;
-            padding: 20px;
-            text-align: center;
-        }
-        .content {
-            margin: 20px 0;
-            padding: 20px;
-            background-color: white;
-            border-radius: 5px;
-        }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-            margin: 20px 0;
-        }
-        th, td {
-            border: 1px solid #ddd;
-            padding: 8px;
-            text-align: left;
-        }
-        th {
-            background-color: #f2f2f2;
-        }
-        .footer {
-            margin-top: 20px;
-            text-align: center;
-            color: #666;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>Sample HTML Document</h1>
-        <p>This is a sample HTML document for PDF conversion</p>
-    </div>
+    semaphore = asyncio.Semaphore(concurrency)
     
-    <div class="content">
-        <h2>About This Document</h2>
-        <p>This document demonstrates the capabilities of converting HTML to PDF using pwhtmltopdf library. It includes:</p>
-        <ul>
-            <li>Styled text with CSS</li>
-            <li>Tables with borders</li>
-            <li>Formatted headings and paragraphs</li>
-            <li>Background colors</li>
-        </ul>
-        
-        <h2>Sample Table</h2>
-        <table>
-            <tr>
-                <th>Product</th>
-                <th>Price</th>
-                <th>Category</th>
-            </tr>
-            <tr>
-                <td>Widget A</td>
-                <td>$19.99</td>
-                <td>Electronics</td>
-            </tr>
-            <tr>
-                <td>Widget B</td>
-                <td>$29.99</td>
-                <td>Home</td>
-            </tr>
-            <tr>
-                <td>Widget C</td>
-                <td>$39.99</td>
-                <td>Office</td>
-            </tr>
-        </table>
-        
-        <h2>Additional Content</h2>
-        <p>Lorem ipsum dolor sit amet, consectetur adipiscing elit. Nullam auctor, nisl eget ultricies tincidunt, nisl nisl aliquam nisl, eget ultricies nisl nisl eget nisl. Nullam auctor, nisl eget ultricies tincidunt, nisl nisl aliquam nisl, eget ultricies nisl nisl eget nisl.</p>
-    </div>
+    async def convert_one(html_file):
+        async with semaphore:
+            await convert_html_to_pdf(html_file, pdf_output_paths[html_file], pdf_options, converter=converter)
     
-    <div class="footer">
-        <p>Generated on: October 3, 2025</p>
-    </div>
-</body>
-</html>"""
+    try:
+        # A failed file is already reported by convert_html_to_pdf; let the rest of the batch finish
+        results = await asyncio.gather(
+            *(convert_one(html_file) for html_file in html_files), return_exceptions=True
+        )
+    finally:
+        await converter.close()
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    failed = [html_file for html_file, result in zip(html_files, results) if isinstance(result, Exception)]
+    if failed:
+        print(f"Failed to convert {len(failed)} of {len(html_files)} HTML files:")
+        for html_file in failed:
+            print(f"  {html_file}")
     
+    return failed
+
+
+def create_sample_html(file_path):
+    """Create a sample HTML file for testing."""
+    Path(file_path).write_text(_SAMPLE_HTML, encoding='utf-8')
     print(f"Created sample HTML file: {file_path}")
 
 
@@ -506,35 +786,17 @@ async def main():
                 output_path = arg
         
         # Define PDF options
-        pdf_options = {
-            'format': 'A4',
-            'print_background': True,
-            'margin': {
-                'top': '20px',
-                'bottom': '20px',
-                'left': '20px',
-                'right': '20px'
-            }
-        }
+        pdf_options = copy.deepcopy(DEFAULT_PDF_OPTIONS)
         
         await merge_linked_html_to_pdf(index_path, output_path, pdf_options, max_depth=max_depth)
         return
     
     # Define PDF options
-    pdf_options = {
-        'format': 'A4',
-        'print_background': True,
-        'margin': {
-            'top': '20px',
-            'bottom': '20px',
-            'left': '20px',
-            'right': '20px'
-        }
-    }
+    pdf_options = copy.deepcopy(DEFAULT_PDF_OPTIONS)
     
     input_path = Path(sys.argv[1])
     
-    if input_path.is_file() and input_path.suffix.lower() in ['.html', '.htm']:
+    if input_path.is_file() and input_path.suffix.lower() in HTML_SUFFIXES:
         # Convert single HTML file
         output_path = None
         if len(sys.argv) > 2:
@@ -548,7 +810,14 @@ async def main():
         if len(sys.argv) > 2:
             output_dir = sys.argv[2]
         
-        await convert_multiple_html_files(input_path, output_dir, pdf_options)
+        try:
+            failed = await convert_multiple_html_files(input_path, output_dir, pdf_options)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        
+        if failed:
+            sys.exit(1)
         
     else:
         print(f"Error: '{input_path}' is not a valid HTML file or directory")
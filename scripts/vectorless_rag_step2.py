@@ -31,16 +31,26 @@ Usage Examples:
         --model github_copilot/gpt-5-mini \
         --query "How are registers and fields modeled in DML?"
 
+    # Several queries at once, answered concurrently
+    .venv/bin/python3 scripts/vectorless_rag_step2.py \
+        --json_path results.4.1/drm_structure.json \
+        --model github_copilot/gpt-5-mini \
+        --query "What are templates in DML?" \
+        --query "How do reset mechanisms work in DML?"
+
 Requirements:
     - JSON file with PageIndex tree structure (from Step 1)
     - LiteLLM configured for GitHub Copilot (uses OAuth2)
 """
 
 import argparse
+import hashlib
 import json
 import sys
 import os
 import asyncio
+import tempfile
+import textwrap
 from pathlib import Path
 
 # Add parent directory to path to import pageindex utils
@@ -53,6 +63,12 @@ except ImportError:
     LITELLM_AVAILABLE = False
     print("Warning: litellm not available. Install with: pip install litellm>=1.60.0")
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 from pageindex import utils
 
 
@@ -60,24 +76,28 @@ def create_node_mapping(tree):
     """Create a flat mapping of node_id -> node from tree structure."""
     node_map = {}
     
-    def traverse(node):
+    # Walk the tree with an explicit stack; lists are pushed reversed to keep document order
+    stack = [tree]
+    while stack:
+        node = stack.pop()
         if isinstance(node, dict):
             if 'node_id' in node:
                 node_map[node['node_id']] = node
             if 'nodes' in node:
-                traverse(node['nodes'])
+                stack.append(node['nodes'])
         elif isinstance(node, list):
-            for item in node:
-                traverse(item)
+            stack.extend(reversed(node))
     
-    traverse(tree)
     return node_map
 
 
 def load_tree_structure(json_path: str) -> dict:
     """Load the PageIndex tree structure from JSON file."""
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if ORJSON_AVAILABLE:
+        data = orjson.loads(Path(json_path).read_bytes())
+    else:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
     
     # Handle both direct structure and wrapped structure
     if 'structure' in data:
@@ -116,17 +136,90 @@ async def call_llm_async(prompt: str, model: str = "gpt-4o", temperature: float
         raise
 
 
-async def tree_search(query: str, tree: dict, model: str, api_key: str = None) -> dict:
+def dump_search_tree(tree) -> str:
+    """Serialize a tree in the indented form used in the tree search prompt."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(tree, option=orjson.OPT_INDENT_2).decode('utf-8')
+    # Keep non-ASCII text as-is, like orjson, so the prompt and its cache key match either way
+    return json.dumps(tree, indent=2, ensure_ascii=False)
+
+
+def count_prompt_tokens(text: str, model: str) -> int:
+    """Count tokens for a model, using the gpt-4o encoding when no model is given or tiktoken does not know it."""
+    if not model:
+        return utils.count_tokens(text, model="gpt-4o")
+    try:
+        return utils.count_tokens(text, model=model)
+    except KeyError:
+        return utils.count_tokens(text, model="gpt-4o")
+
+
+def tree_levels(tree) -> list:
+    """Group the nodes of a tree by depth: [[root nodes], [their children], ...]."""
+    levels = []
+    level = tree if isinstance(tree, list) else [tree]
+    while level:
+        levels.append(level)
+        level = [child for node in level for child in node.get('nodes') or []]
+    return levels
+
+
+def tree_search_json(tree, max_tokens: int = None, model: str = None) -> str:
+    """
+    Serialize the tree without node text, as it is embedded in the tree search prompt.
+    
+    If max_tokens is given and the tree is larger, it is pruned from the bottom up until it fits:
+    first summaries are dropped level by level, then the deepest levels of nodes themselves.
+    """
+    # remove_fields builds new containers, so pruning below leaves the loaded tree untouched
+    tree_without_text = utils.remove_fields(tree, fields=['text'])
+    tree_json = dump_search_tree(tree_without_text)
+    if max_tokens is None or count_prompt_tokens(tree_json, model) <= max_tokens:
+        return tree_json
+    
+    levels = tree_levels(tree_without_text)
+    
+    # Drop summaries from the deepest level upward, keeping every node id and title
+    prunes = [(level, 'summary') for level in reversed(levels)]
+    # Then drop whole levels of child nodes, deepest first; their parents stay selectable
+    prunes += [(level, 'nodes') for level in reversed(levels[:-1])]
+    
+    for level, field in prunes:
+        for node in level:
+            node.pop(field, None)
+        tree_json = dump_search_tree(tree_without_text)
+        tree_tokens = count_prompt_tokens(tree_json, model)
+        if tree_tokens <= max_tokens:
+            print(f"Pruned the search tree to {tree_tokens} tokens (limit: {max_tokens})")
+            return tree_json
+    
+    print(f"Warning: The search tree is still {tree_tokens} tokens after pruning it down to its root nodes, "
+          f"over the limit of {max_tokens}")
+    return tree_json
+
+
+def tree_search_cache_path(cache_dir: str, model: str, search_prompt: str) -> Path:
+    """Path of the cached tree search result for a model and prompt (which embeds the query and tree)."""
+    digest = hashlib.blake2b(f"{model}\0{search_prompt}".encode('utf-8'), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{digest}.json"
+
+
+async def tree_search(query: str, tree: dict, model: str, api_key: str = None, cache_dir: str = None,
+                      tree_json: str = None) -> dict:
     """
     Step 2.1: Use LLM for tree search to identify nodes containing relevant context.
     
+    If cache_dir is given, results are stored there and reused for the same model, query and tree.
+    Pass tree_json (from tree_search_json) to reuse one serialization of the tree across queries.
+    
     Returns:
         dict with 'thinking' and 'node_list' keys
     """
     print("Step 2.1: Performing tree search with LLM...")
     
     # Remove text field to reduce prompt size
-    tree_without_text = utils.remove_fields(tree.copy(), fields=['text'])
+    if tree_json is None:
+        tree_json = tree_search_json(tree)
     
     search_prompt = f"""
 You are given a question and a tree structure of a document.
@@ -136,7 +229,7 @@ Your task is to find all nodes that are likely to contain the answer to the ques
 Question: {query}
 
 Document tree structure:
-{json.dumps(tree_without_text, indent=2)}
+{tree_json}
 
 Please reply in the following JSON format:
 {{
@@ -146,12 +239,27 @@ Please reply in the following JSON format:
 Directly return the final JSON structure. Do not output anything else.
 """
     
+    # Reuse a previous answer for the same model, query and tree
+    cache_path = None
+    if cache_dir:
+        cache_path = tree_search_cache_path(cache_dir, model, search_prompt)
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            # A damaged entry is a miss; it is overwritten below
+            print(f"Warning: Ignoring unreadable cached tree search result: {cache_path}")
+        else:
+            print(f"Using cached tree search result: {cache_path}")
+            return cached
+    
     tree_search_result = await call_llm_async(search_prompt, model=model, api_key=api_key)
     
     # Parse JSON response
     try:
         result_json = json.loads(tree_search_result)
-        return result_json
     except json.JSONDecodeError as e:
         print(f"Warning: Failed to parse JSON response. Attempting cleanup...")
         # Try to extract JSON from markdown code blocks
@@ -161,10 +269,25 @@ Directly return the final JSON structure. Do not output anything else.
             cleaned = '\n'.join(lines[1:-1]) if len(lines) > 2 else cleaned
         try:
             result_json = json.loads(cleaned)
-            return result_json
         except:
             print(f"Error: Could not parse LLM response as JSON: {e}")
             return {"thinking": "Failed to parse response", "node_list": []}
+    
+    # Only successfully parsed results are cached. The entry is written to a temporary file and
+    # renamed into place, so an interrupted run cannot leave a truncated entry behind
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = tempfile.NamedTemporaryFile('w', dir=cache_path.parent, suffix='.tmp', delete=False,
+                                                encoding='utf-8')
+        try:
+            with temp_file:
+                json.dump(result_json, temp_file, indent=2)
+            os.replace(temp_file.name, cache_path)
+        except BaseException:
+            Path(temp_file.name).unlink(missing_ok=True)
+            raise
+    
+    return result_json
 
 
 def print_retrieved_nodes(node_list: list, node_map: dict):
@@ -200,38 +323,8 @@ Provide a clear, concise answer based only on the context provided.
     return answer
 
 
-async def main_async(args):
-    """Main async workflow for Steps 2-3."""
-    
-    # Load tree structure
-    print(f"Loading tree structure from: {args.json_path}")
-    tree = load_tree_structure(args.json_path)
-    
-    if isinstance(tree, list):
-        print(f"Loaded tree with {len(tree)} root nodes")
-    else:
-        print(f"Loaded tree: {type(tree)}")
-    
-    # Step 2.1: Tree search
-    search_result = await tree_search(args.query, tree, args.model, args.api_key)
-    
-    # Print reasoning process
-    print("\n" + "=" * 80)
-    print("REASONING PROCESS:")
-    print("=" * 80)
-    thinking = search_result.get('thinking', 'No reasoning provided')
-    # Wrap text for better readability
-    import textwrap
-    wrapped = textwrap.fill(thinking, width=80)
-    print(wrapped)
-    print("=" * 80)
-    
-    # Step 2.2: Print retrieved nodes
-    node_map = create_node_mapping(tree)
-    node_list = search_result.get('node_list', [])
-    print_retrieved_nodes(node_list, node_map)
-    
-    # Step 3.1: Extract relevant context
+def extract_relevant_content(node_list: list, node_map: dict) -> str:
+    """Step 3.1: Join the text (or titled summary) of the retrieved nodes into one context string."""
     print("\nStep 3.1: Extracting relevant context from retrieved nodes...")
     relevant_texts = []
     for node_id in node_list:
@@ -250,12 +343,54 @@ async def main_async(args):
         else:
             print(f"Warning: Node {node_id} not found in tree")
     
-    if not relevant_texts:
+    return "\n\n".join(relevant_texts)
+
+
+async def answer_query(query: str, tree, tree_json: str, node_map: dict, args, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Run Steps 2-3 for one query: tree search, context extraction and answer generation.
+    
+    Returns:
+        dict with 'search_result', 'relevant_content' and 'answer' (None if no context was found)
+    """
+    # Bound the number of queries with LLM calls in flight
+    async with semaphore:
+        # Step 2.1: Tree search
+        cache_dir = None if args.no_cache else args.cache_dir
+        search_result = await tree_search(query, tree, args.model, args.api_key, cache_dir=cache_dir,
+                                          tree_json=tree_json)
+        
+        # Step 3.1: Extract relevant context
+        relevant_content = extract_relevant_content(search_result.get('node_list', []), node_map)
+        
+        # Step 3.2: Generate answer
+        answer = None
+        if relevant_content:
+            answer = await generate_answer(query, relevant_content, args.model, args.api_key)
+    
+    return {"search_result": search_result, "relevant_content": relevant_content, "answer": answer}
+
+
+def print_query_report(result: dict, node_map: dict):
+    """Print the reasoning, retrieved nodes, context preview and answer for one query."""
+    # Print reasoning process
+    print("\n" + "=" * 80)
+    print("REASONING PROCESS:")
+    print("=" * 80)
+    thinking = result['search_result'].get('thinking', 'No reasoning provided')
+    # Wrap text for better readability
+    wrapped = textwrap.fill(thinking, width=80)
+    print(wrapped)
+    print("=" * 80)
+    
+    # Step 2.2: Print retrieved nodes
+    print_retrieved_nodes(result['search_result'].get('node_list', []), node_map)
+    
+    relevant_content = result['relevant_content']
+    if not relevant_content:
         print("Error: No relevant context found. Cannot generate answer.")
         return
     
-    relevant_content = "\n\n".join(relevant_texts)
-    
     # Show preview of retrieved context
     print("\nRetrieved Context Preview:")
     print("-" * 80)
@@ -264,18 +399,66 @@ async def main_async(args):
     print("-" * 80)
     print(f"Total context length: {len(relevant_content)} characters")
     
-    # Step 3.2: Generate answer
-    answer = await generate_answer(args.query, relevant_content, args.model, args.api_key)
-    
     # Print final answer
     print("\n" + "=" * 80)
     print("GENERATED ANSWER:")
     print("=" * 80)
-    wrapped_answer = textwrap.fill(answer, width=80)
+    wrapped_answer = textwrap.fill(result['answer'], width=80)
     print(wrapped_answer)
     print("=" * 80)
 
 
+async def main_async(args):
+    """Main async workflow for Steps 2-3."""
+    
+    # Load tree structure
+    print(f"Loading tree structure from: {args.json_path}")
+    tree = load_tree_structure(args.json_path)
+    
+    if isinstance(tree, list):
+        print(f"Loaded tree with {len(tree)} root nodes")
+    else:
+        print(f"Loaded tree: {type(tree)}")
+    
+    # Serialize the text-free tree for the search prompt once, pruned to the token budget
+    tree_json = tree_search_json(tree, max_tokens=args.max_tree_tokens, model=args.model)
+    node_map = create_node_mapping(tree)
+    
+    # Queries are independent, so their LLM calls run concurrently
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # A failed query is reported on its own instead of discarding the answers of the others
+    results = await asyncio.gather(
+        *(answer_query(query, tree, tree_json, node_map, args, semaphore) for query in args.queries),
+        return_exceptions=True
+    )
+    
+    # Report in the order the queries were given
+    failed = 0
+    for i, (query, result) in enumerate(zip(args.queries, results), 1):
+        if len(args.queries) > 1:
+            print("\n" + "#" * 80)
+            print(f"QUERY {i}/{len(args.queries)}: {query}")
+            print("#" * 80)
+        if isinstance(result, Exception):
+            print(f"Error: Query failed: {result}")
+            failed += 1
+            continue
+        print_query_report(result, node_map)
+    
+    return failed
+
+
+def positive_int(value: str) -> int:
+    """argparse type for options that must be an integer of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value!r}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Vectorless RAG Step 2-3: Reasoning-Based Retrieval with LiteLLM"
@@ -292,17 +475,53 @@ def main():
     )
     parser.add_argument(
         "--query",
-        required=True,
-        help="Query/question to answer"
+        action="append",
+        default=[],
+        help="Query/question to answer; repeat to answer several queries concurrently"
+    )
+    parser.add_argument(
+        "--queries_file",
+        default=None,
+        help="File with one query per line, answered in addition to any --query values"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=8,
+        help="Maximum number of queries with LLM calls in flight at once (default: 8)"
     )
     parser.add_argument(
         "--api_key",
         default=None,
         help="Optional API key (LiteLLM uses OAuth2 for GitHub Copilot by default)"
     )
+    parser.add_argument(
+        "--max_tree_tokens",
+        type=positive_int,
+        default=100000,
+        help="Token budget for the tree in the tree search prompt; larger trees are pruned (default: 100000)"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=".cache/tree_search",
+        help="Directory for cached tree search results (default: .cache/tree_search)"
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always call the LLM for tree search, without reading or writing the cache"
+    )
     
     args = parser.parse_args()
     
+    # Collect the queries from --query and --queries_file
+    args.queries = list(args.query)
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            args.queries.extend(line.strip() for line in f if line.strip())
+    if not args.queries:
+        parser.error("at least one --query or a non-empty --queries_file is required")
+    
     # Check if JSON file exists
     if not os.path.isfile(args.json_path):
         print(f"Error: JSON file not found: {args.json_path}")
@@ -315,7 +534,10 @@ def main():
         sys.exit(1)
     
     # Run async main
-    asyncio.run(main_async(args))
+    failed = asyncio.run(main_async(args))
+    if failed:
+        print(f"\nError: {failed} of {len(args.queries)} queries failed")
+        sys.exit(1)
 
 
 if __name__ == '__main__':